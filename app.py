@@ -4,130 +4,181 @@ AmIABot.com MVP - Main Flask Application
 A Modern Turing Test Game with real-time chat matching
 """
 
+# Patch before anything else imports socket, ssl, threading or time, so
+# blocking calls (including OpenAI requests) yield to other greenlets
+import eventlet
+eventlet.monkey_patch()
+
+import atexit
+import logging
 import os
+import queue
 import random
+import redis
 import fakeredis
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from dotenv import load_dotenv
-from openai import OpenAI
-from flask import Flask, render_template, request
+from flask import Flask, abort, render_template, request
 from flask_socketio import SocketIO, emit
-from eventlet import monkey_patch
+
+assert eventlet.patcher.is_monkey_patched('socket'), "eventlet failed to patch socket"
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Debug logging is lazily formatted and skipped entirely at the default INFO level.
+# Callers only enqueue records; a listener thread does the actual stdout writes.
+log_queue = queue.SimpleQueue()
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+    handlers=[QueueHandler(log_queue)]
+)
+log_listener = QueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
+logger = logging.getLogger("amiabot")
+
 # Import custom modules
-from config import Config
+from config import CONFIG
 from bot import TuringBot
+from batcher import BotRequestBatcher
+from rate_limiter import RequestBudget
 from game_state import GameState
 
 # Initialize Flask app
 app = Flask(__name__)
-app.config.from_object(Config)
+app.config.from_object(CONFIG)
 
-monkey_patch()
+# Game state and timers live in this process, so the app runs as a single worker
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode='eventlet'
+)
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
-
-# Initialize FakeRedis for development (no Redis server needed)
+# Use real Redis in production, FakeRedis for development (no Redis server needed)
 try:
-    storage_client = fakeredis.FakeRedis()
-    storage_client.ping()
-    print("FakeRedis connected successfully (development mode)")
-    print("   Note: Using in-memory storage - data won't persist across restarts")
+    if app.config['USE_REDIS']:
+        storage_client = redis.Redis.from_url(app.config['REDIS_URL'])
+        storage_client.ping()
+        logger.info("Redis connected successfully")
+    else:
+        storage_client = fakeredis.FakeRedis()
+        storage_client.ping()
+        logger.info("FakeRedis connected successfully (development mode)")
+        logger.info("Using in-memory storage - data won't persist across restarts")
 except ImportError:
-    print("Warning: fakeredis not installed. Install with: pip install fakeredis")
+    logger.warning("fakeredis not installed. Install with: pip install fakeredis")
     storage_client = None
 except Exception as e:
-    print(f"Warning: Storage not available: {e}")
+    logger.warning("Storage not available: %s", e)
     storage_client = None
 
-# Initialize OpenAI client
-openai_client = OpenAI()  # Uses OPENAI_API_KEY from environment
-
 # Initialize game state and bot
-game_state = GameState()
-bot = TuringBot()
+game_state = GameState(
+    session_ttl_hours=app.config['SESSION_TTL_HOURS'],
+    concurrency_model=app.config['CONCURRENCY_MODEL']
+)
+bot = TuringBot(
+    cache=storage_client,
+    budget=RequestBudget(app.config['OPENAI_MAX_RPM'], app.config['OPENAI_MAX_TPM'])
+)
+
+# Coalesce concurrent bot turns into shared OpenAI requests
+batcher = BotRequestBatcher(bot)
+socketio.start_background_task(batcher.run)
 
 # Timer management
 active_timers = {}
 
 
-def schedule_timeout(delay: int, callback, *args):
-    """Schedule a callback to run after delay seconds using SocketIO background task"""
+def session_room(session_id: str) -> str:
+    """Socket.IO room holding every participant of a session"""
+    return f"session:{session_id}"
+
+
+def join_session_room(session_id: str, *user_ids):
+    """Add participants to their session's room for session-wide broadcasts"""
+    for user_id in user_ids:
+        socketio.server.enter_room(user_id, session_room(session_id), namespace='/')
 
-    def wrapper():
-        import time
-        time.sleep(delay)
-        callback(*args)
 
-    task = socketio.start_background_task(wrapper)
-    return task
+def schedule_timeout(delay: int, callback, *args):
+    """Schedule a callback to run after delay seconds on the eventlet hub's timer heap
+
+    No greenlet exists while waiting; the callback gets its own background
+    task when the timer fires so it can block without stalling the hub.
+    """
+    return eventlet.hubs.get_hub().schedule_call_global(
+        delay, socketio.start_background_task, callback, *args
+    )
 
 
 # WebSocket event handlers
 @socketio.on('connect')
 def handle_connect():
     user_id = request.sid
-    print(f"=== CONNECT === User connected: {user_id}")
-    print(f"Current queue size: {len(game_state.queue)}")
-    print(f"Active sessions: {len(game_state.active_sessions)}")
-    print(f"User agent: {request.environ.get('HTTP_USER_AGENT', 'unknown')}")
+    logger.debug("=== CONNECT === User connected: %s", user_id)
+    logger.debug("Current queue size: %s", game_state.get_queue_size())
+    logger.debug("Active sessions: %s", game_state.get_session_count())
+    logger.debug("User agent: %s", request.environ.get('HTTP_USER_AGENT', 'unknown'))
     emit('connected', {'status': 'connected'})
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     user_id = request.sid
-    print(f"=== DISCONNECT === User disconnected: {user_id}")
-    print(f"Disconnect reason: {request.environ.get('disconnect_reason', 'unknown')}")
+    logger.debug("=== DISCONNECT === User disconnected: %s", user_id)
+    logger.debug("Disconnect reason: %s", request.environ.get('disconnect_reason', 'unknown'))
 
     # Remove from queue if present
     was_in_queue = game_state.remove_from_queue(user_id)
     if was_in_queue:
-        print(f"Removed {user_id} from queue")
+        logger.debug("Removed %s from queue", user_id)
 
     # Handle active session
-    session = game_state.get_user_session(user_id)
+    session = game_state.get_user_session_snapshot(user_id)
     if session:
-        session_id = session['id']
-        print(f"User {user_id} was in session {session_id} (bot: {session['is_bot']})")
+        session_id = session.id
+        logger.debug("User %s was in session %s (bot: %s)", user_id, session_id, session.is_bot)
         
-        if session['is_bot']:
+        if session.is_bot:
             # For bot sessions, just end the session
-            print(f"User {user_id} disconnected from bot session {session_id}")
+            logger.debug("User %s disconnected from bot session %s", user_id, session_id)
         else:
             # For human sessions, notify the other user
-            other_user = session['user2'] if session['user1'] == user_id else session['user1']
+            other_user = session.user2 if session.user1 == user_id else session.user1
             if other_user:
-                print(f"Notifying {other_user} that {user_id} disconnected")
+                logger.debug("Notifying %s that %s disconnected", other_user, user_id)
                 socketio.emit('partner_disconnected', room=other_user)
-                print(f"Sent partner_disconnected to {other_user}")
+                logger.debug("Sent partner_disconnected to %s", other_user)
 
         # End the session
         game_state.end_session(session_id)
-        print(f"Ended session {session_id}")
+        socketio.close_room(session_room(session_id), namespace='/')
+        logger.debug("Ended session %s", session_id)
     else:
-        print(f"User {user_id} was not in any active session")
+        logger.debug("User %s was not in any active session", user_id)
 
 
 @socketio.on('join_queue')
 def handle_join_queue():
     user_id = request.sid
-    print(f"User {user_id} joining queue")
+    logger.debug("User %s joining queue", user_id)
 
     # Add to queue with timestamp
     success = game_state.add_to_queue(user_id)
     if success:
-        emit('queue_joined', {'position': len(game_state.queue)})
+        emit('queue_joined', {'position': game_state.get_queue_size()})
     else:
         emit('error', {'message': 'Already in queue'})
         return
 
     # Schedule bot match after random delay (15-25 seconds) as fallback
     bot_delay = random.uniform(15, 25)
-    print(f"User {user_id} will be matched with bot in {bot_delay:.1f}s if no human found")
+    logger.debug("User %s will be matched with bot in %.1fs if no human found", user_id, bot_delay)
     schedule_timeout(bot_delay, match_with_bot, user_id)
 
     # Wait minimum 5 seconds before attempting first match (reduced for testing)
@@ -138,37 +189,39 @@ def attempt_match(user_id, attempt_count):
     """Try to match a user with a partner after minimum wait time"""
     with app.app_context():
         if not game_state.is_user_in_queue(user_id):
-            print(f"User {user_id} not in queue, skipping match attempt")
+            logger.debug("User %s not in queue, skipping match attempt", user_id)
             return  # User already matched or left
 
         attempt_count += 1
-        print(f"Attempt {attempt_count} to match user {user_id}")
-        print(f"Current queue: {[item['user_id'] for item in game_state.queue]}")
+        logger.debug("Attempt %s to match user %s", attempt_count, user_id)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Current queue: %s", [item['user_id'] for item in game_state.get_queue_snapshot()])
 
         # Try to find human partner who has also waited at least 5 seconds
         partner = game_state.get_queue_partner(exclude=user_id, min_wait_seconds=5)
 
         if partner and partner != user_id:
             # Human-to-human match
-            print(f"Matching humans: {user_id} <-> {partner}")
+            logger.debug("Matching humans: %s <-> %s", user_id, partner)
             game_state.remove_from_queue(user_id)
             game_state.remove_from_queue(partner)
             session_id = game_state.create_session(user_id, partner, is_bot=False)
+            join_session_room(session_id, user_id, partner)
 
             # Notify both users individually (more reliable than rooms in background threads)
-            print(f"Sending match_found to {user_id}")
+            logger.debug("Sending match_found to %s", user_id)
             socketio.emit('match_found', {
                 'session_id': session_id,
                 'partner_type': 'human'
             }, to=user_id)
 
-            print(f"Sending match_found to {partner}")
+            logger.debug("Sending match_found to %s", partner)
             socketio.emit('match_found', {
                 'session_id': session_id,
                 'partner_type': 'human'
             }, to=partner)
 
-            print(f"Sent match_found to both {user_id} and {partner}")
+            logger.debug("Sent match_found to both %s and %s", user_id, partner)
 
             # Start conversation timer
             schedule_timeout(app.config['CONVERSATION_TIME'], end_conversation, session_id)
@@ -177,63 +230,60 @@ def attempt_match(user_id, attempt_count):
             if attempt_count < 15:
                 schedule_timeout(2, attempt_match, user_id, attempt_count)
             else:
-                print(f"Max attempts reached for user {user_id}, bot match should trigger soon")
+                logger.debug("Max attempts reached for user %s, bot match should trigger soon", user_id)
 
 
 def match_with_bot(user_id):
     """Match user with bot after waiting period"""
     if not game_state.is_user_in_queue(user_id):
-        print(f"User {user_id} not in queue, already matched or left")
+        logger.debug("User %s not in queue, already matched or left", user_id)
         return  # User already matched or left
 
-    print(f"Timeout reached - Matching {user_id} with bot")
+    logger.debug("Timeout reached - Matching %s with bot", user_id)
     game_state.remove_from_queue(user_id)
     session_id = game_state.create_session(user_id, is_bot=True)
+    join_session_room(session_id, user_id)
 
-    print(f"Sending match_found (bot) to {user_id}")
+    logger.debug("Sending match_found (bot) to %s", user_id)
     socketio.emit('match_found', {
         'session_id': session_id,
         'partner_type': 'unknown'  # Don't reveal it's a bot
     }, to=user_id)
 
-    print(f"Sent match_found (bot) to {user_id}")
+    logger.debug("Sent match_found (bot) to %s", user_id)
 
     # Send bot opening message
     def send_bot_opening():
         try:
-            import time
-            time.sleep(1.0)  # Brief delay before bot speaks
+            eventlet.sleep(1.0)  # Brief delay before bot speaks
             
-            session = game_state.get_session(session_id)
-            if session and session['status'] == 'active':
+            session = game_state.get_session_snapshot(session_id)
+            if session and session.status == 'active':
                 opening_message = bot.get_opening_message()
-                print(f"Bot opening message: {opening_message}")
+                logger.debug("Bot opening message: %s", opening_message)
                 
                 # Add to session history
-                bot_message_data = {
+                opening_iso = datetime.now().isoformat()
+                game_state.add_turn_to_session(session_id, {
                     'content': opening_message,
                     'sender': 'bot',
-                    'timestamp': datetime.now().isoformat(),
+                    'timestamp': opening_iso,
                     'is_bot': True
-                }
-                session['messages'].append(bot_message_data)
+                }, {"role": "assistant", "content": opening_message})
                 
                 # Send to user
-                print(f"Attempting to send bot opening message to {user_id}")
+                logger.debug("Attempting to send bot opening message to %s", user_id)
                 socketio.emit('new_message', {
                     'message': opening_message,
                     'sender': 'partner',
-                    'timestamp': bot_message_data['timestamp']
+                    'timestamp': opening_iso
                 }, to=user_id)
                 
-                print(f"Bot opening message sent to {user_id}: {opening_message}")
-                print(f"Bot opening data: {{'message': '{opening_message}', 'sender': 'partner', 'timestamp': '{bot_message_data['timestamp']}'}}")
+                logger.debug("Bot opening message sent to %s: %s", user_id, opening_message)
             else:
-                print(f"Session {session_id} not active for opening message")
+                logger.debug("Session %s not active for opening message", session_id)
         except Exception as ex:
-            print(f"Error sending bot opening message: {ex}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error sending bot opening message: %s", ex)
 
     socketio.start_background_task(send_bot_opening)
 
@@ -246,131 +296,143 @@ def handle_message(data):
     user_id = request.sid
     message = data.get('message', '').strip()
     
-    print(f"=== MESSAGE RECEIVED === From: {user_id}")
-    print(f"Message: '{message}'")
-    print(f"Data received: {data}")
+    logger.debug("=== MESSAGE RECEIVED === From: %s", user_id)
+    logger.debug("Message: '%s'", message)
+    logger.debug("Data received: %s", data)
 
     if not message:
-        print(f"Empty message from {user_id}")
+        logger.debug("Empty message from %s", user_id)
         return
 
-    session = game_state.get_user_session(user_id)
+    session = game_state.get_user_session_snapshot(user_id)
     if not session:
-        print(f"ERROR: No session found for user {user_id}")
-        print(f"Current user sessions: {game_state.user_sessions}")
+        logger.warning("No session found for user %s", user_id)
+        if logger.isEnabledFor(logging.DEBUG):
+            # The snapshot itself is the cost, so skip building it unless it gets logged
+            logger.debug("Current user sessions: %s", game_state.get_user_sessions_snapshot())
         emit('error', {'message': 'No active session'})
         return
         
-    print(f"Session found: {session['id']} (status: {session['status']}, bot: {session['is_bot']})")
+    logger.debug("Session found: %s (status: %s, bot: %s)", session.id, session.status, session.is_bot)
     
-    if session['status'] != 'active':
-        print(f"ERROR: Session {session['id']} not active (status: {session['status']})")
+    if session.status != 'active':
+        logger.warning("Session %s not active (status: %s)", session.id, session.status)
         emit('error', {'message': 'Session not active'})
         return
 
     # Check if conversation time has expired
-    elapsed = (datetime.now() - session['start_time']).total_seconds()
+    now = datetime.now()
+    elapsed = (now - session.start_time).total_seconds()
     if elapsed >= app.config['CONVERSATION_TIME']:
         emit('conversation_ended')
         return
 
-    # Add message to session history
+    # One timestamp and partner lookup for the whole event
+    now_iso = now.isoformat()
+    other_user = session.user2 if session.user1 == user_id else session.user1
+
+    # Add message to session history, keeping the bot context from before it; the bot adds the message itself
     message_data = {
         'content': message,
         'sender': user_id,
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': now_iso,
         'is_bot': False
     }
-    session['messages'].append(message_data)
-    print(f"Added message to session history. Total messages: {len(session['messages'])}")
+    bot_context = game_state.add_turn_to_session(session.id, message_data, {"role": "user", "content": message})
+    if bot_context is None:
+        emit('error', {'message': 'No active session'})
+        return
+    logger.debug("Added message to session history. Total messages: %s", session.message_count + 1)
 
     # Send to partner
-    session_id = session['id']
-    if session['is_bot']:
+    session_id = session.id
+    if session.is_bot:
         # For bot sessions, only send to the user (bot will respond separately)
-        print(f"Bot session - not sending to partner, bot will respond")
+        logger.debug("Bot session - not sending to partner, bot will respond")
     else:
         # For human sessions, send to the other user
-        other_user = session['user2'] if session['user1'] == user_id else session['user1']
         if other_user:
-            print(f"Sending message to human partner: {other_user}")
+            logger.debug("Sending message to human partner: %s", other_user)
             socketio.emit('new_message', {
                 'message': message,
                 'sender': 'partner',
-                'timestamp': message_data['timestamp']
+                'timestamp': now_iso
             }, to=other_user)
-            print(f"Sent new_message to {other_user}")
+            logger.debug("Sent new_message to %s", other_user)
         else:
-            print(f"ERROR: No other user found in session {session_id}")
+            logger.warning("No other user found in session %s", session_id)
 
     # Confirm to sender
-    print(f"Confirming message sent to sender {user_id}")
+    logger.debug("Confirming message sent to sender %s", user_id)
     emit('message_sent', {
         'message': message,
-        'timestamp': message_data['timestamp']
+        'timestamp': now_iso
     })
-    print(f"Sent message_sent confirmation to {user_id}")
+    logger.debug("Sent message_sent confirmation to %s", user_id)
 
     # If partner is bot, generate response
-    if session['is_bot']:
-        print(f"Bot session detected for user {user_id}, generating response...")
+    if session.is_bot:
+        logger.debug("Bot session detected for user %s, generating response...", user_id)
         
         # Show typing indicator
         socketio.emit('partner_typing', {'typing': True}, to=user_id)
 
         def generate_and_send():
             try:
-                print(f"Starting bot response generation for user {user_id}")
-                
-                # Generate bot response
-                bot_response = bot.get_response(message, session['messages'])
-                print(f"Bot generated response: {bot_response}")
-                
-                # Simple delay calculation
-                base_delay = random.uniform(1.0, 2.0)
-                char_delay = len(bot_response) / 10.0  # ~10 characters per second
-                total_delay = min(max(base_delay + char_delay, 0.5), 4.0)
-                
-                print(f"Bot responding in {total_delay:.1f}s")
+                logger.debug("Starting bot response generation for user %s", user_id)
                 
-                # Wait for the calculated delay
-                import time
-                time.sleep(total_delay)
-
-                # Check if session is still active
-                current_session = game_state.get_session(session_id)
-                if not current_session or current_session['status'] != 'active':
-                    print(f"Session {session_id} no longer active, skipping bot response")
+                # Stream bot response as it's generated
+                pieces = []
+                current_session = game_state.get_session_snapshot(session_id)
+                pending = batcher.submit(session_id, message, bot_context)
+                for piece in pending.wait():
+                    # Small pause between sentences, like someone finishing a thought
+                    if pieces:
+                        socketio.sleep(random.uniform(0.3, 0.8))
+
+                    # Check if session is still active
+                    current_session = game_state.get_session_snapshot(session_id)
+                    if not current_session or current_session.status != 'active':
+                        break
+
+                    pieces.append(piece)
+                    socketio.emit('new_message_chunk', {
+                        'chunk': piece,
+                        'sender': 'partner'
+                    }, to=user_id)
+
+                if not current_session or current_session.status != 'active':
+                    logger.debug("Session %s no longer active, skipping bot response", session_id)
                     socketio.emit('partner_typing', {'typing': False}, to=user_id)
                     return
 
+                bot_response = ''.join(pieces).strip()
+                logger.debug("Bot generated response: %s", bot_response)
+
                 # Stop typing indicator
                 socketio.emit('partner_typing', {'typing': False}, to=user_id)
 
                 # Add bot message to history
-                bot_message_data = {
+                reply_iso = datetime.now().isoformat()
+                game_state.add_turn_to_session(session_id, {
                     'content': bot_response,
                     'sender': 'bot',
-                    'timestamp': datetime.now().isoformat(),
+                    'timestamp': reply_iso,
                     'is_bot': True
-                }
-                current_session['messages'].append(bot_message_data)
+                }, {"role": "assistant", "content": bot_response})
 
-                # Send to user
-                print(f"Attempting to send bot response to {user_id}")
+                # Send the complete message so the client can finalize the streamed one
+                logger.debug("Attempting to send bot response to %s", user_id)
                 socketio.emit('new_message', {
                     'message': bot_response,
                     'sender': 'partner',
-                    'timestamp': bot_message_data['timestamp']
+                    'timestamp': reply_iso
                 }, to=user_id)
                 
-                print(f"Bot response sent successfully to {user_id}: {bot_response}")
-                print(f"Bot response data: {{'message': '{bot_response}', 'sender': 'partner', 'timestamp': '{bot_message_data['timestamp']}'}}")
+                logger.debug("Bot response sent successfully to %s: %s", user_id, bot_response)
 
             except Exception as ex:
-                print(f"Error generating bot response: {ex}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Error generating bot response: %s", ex)
                 
                 socketio.emit('partner_typing', {'typing': False}, to=user_id)
                 
@@ -381,13 +443,12 @@ def handle_message(data):
                     'sender': 'partner',
                     'timestamp': datetime.now().isoformat()
                 }, to=user_id)
-                print(f"Sent fallback response to {user_id}")
+                logger.debug("Sent fallback response to %s", user_id)
 
         # Start the generation in a background task
         socketio.start_background_task(generate_and_send)
     else:
         # For human partners, relay typing indicator
-        other_user = session['user2'] if session['user1'] == user_id else session['user1']
         if other_user:
             socketio.emit('partner_typing', {'typing': True}, to=other_user)
             # Auto-stop typing after message sent (already handled above)
@@ -399,12 +460,12 @@ def handle_typing(data):
     user_id = request.sid
     is_typing = data.get('typing', False)
 
-    session = game_state.get_user_session(user_id)
-    if not session or session['status'] != 'active' or session['is_bot']:
+    session = game_state.get_user_session_snapshot(user_id)
+    if not session or session.status != 'active' or session.is_bot:
         return
 
     # Relay to partner
-    other_user = session['user2'] if session['user1'] == user_id else session['user1']
+    other_user = session.user2 if session.user1 == user_id else session.user1
     if other_user:
         socketio.emit('partner_typing', {'typing': is_typing}, to=other_user)
 
@@ -413,24 +474,17 @@ def handle_typing(data):
 
 def end_conversation(session_id: str):
     """End conversation and start decision phase"""
-    session = game_state.get_session(session_id)
-    if not session or session['status'] != 'active':
+    session = game_state.get_session_snapshot(session_id)
+    if not session or session.status != 'active':
         return
 
-    session['status'] = 'decision'
+    # Through GameState so the /stats counters follow the status change
+    game_state.update_session_status(session_id, 'decision')
 
-    # Notify participants that conversation has ended
-    if session['is_bot']:
-        socketio.emit('conversation_ended', {
-            'message': 'Time\'s up! Now decide: was your partner a Bot or Human?'
-        }, to=session['user1'])
-    else:
-        socketio.emit('conversation_ended', {
-            'message': 'Time\'s up! Now decide: was your partner a Bot or Human?'
-        }, to=session['user1'])
-        socketio.emit('conversation_ended', {
-            'message': 'Time\'s up! Now decide: was your partner a Bot or Human?'
-        }, to=session['user2'])
+    # Notify participants that conversation has ended (one broadcast to the session room)
+    socketio.emit('conversation_ended', {
+        'message': 'Time\'s up! Now decide: was your partner a Bot or Human?'
+    }, to=session_room(session_id))
 
     # Start decision timer
     schedule_timeout(app.config['DECISION_TIME'], force_decision, session_id)
@@ -445,58 +499,58 @@ def handle_decision(data):
         emit('error', {'message': 'Invalid decision'})
         return
 
-    session = game_state.get_user_session(user_id)
-    if not session or session['status'] != 'decision':
+    session = game_state.get_user_session_snapshot(user_id)
+    if not session or session.status != 'decision':
         emit('error', {'message': 'Not in decision phase'})
         return
 
     # Record decision
-    session['decisions'][user_id] = decision
+    game_state.add_decision_to_session(session.id, user_id, decision)
 
     # Check if all participants have decided
-    expected_decisions = 2 if not session['is_bot'] else 1
+    expected_decisions = 2 if not session.is_bot else 1
 
-    if len(session['decisions']) >= expected_decisions:
-        reveal_results(session['id'])
+    if len(game_state.get_session_decisions(session.id)) >= expected_decisions:
+        reveal_results(session.id)
     else:
-        if session['is_bot']:
+        if session.is_bot:
             # For bot sessions, immediately reveal results after user decides
-            reveal_results(session['id'])
+            reveal_results(session.id)
         else:
             emit('decision_recorded', {'message': 'Waiting for your partner to decide...'})
 
 
 def force_decision(session_id: str):
     """Force decision phase to end and reveal results"""
-    session = game_state.get_session(session_id)
-    if not session or session['status'] != 'decision':
+    session = game_state.get_session_snapshot(session_id)
+    if not session or session.status != 'decision':
         return
 
     # For any users who haven't decided, record a random decision
-    if not session['is_bot']:
-        expected_users = [session['user1'], session['user2']]
+    if not session.is_bot:
+        expected_users = [session.user1, session.user2]
     else:
-        expected_users = [session['user1']]
+        expected_users = [session.user1]
 
     for user in expected_users:
-        if user not in session['decisions']:
-            session['decisions'][user] = random.choice(['bot', 'human'])
+        if user not in session.decisions:
+            game_state.add_decision_to_session(session_id, user, random.choice(['bot', 'human']))
 
     reveal_results(session_id)
 
 
 def reveal_results(session_id: str):
     """Reveal the results of the Turing test"""
-    session = game_state.get_session(session_id)
+    session = game_state.get_session_snapshot(session_id)
     if not session:
         return
 
     # Determine the truth
-    actual = 'bot' if session['is_bot'] else 'human'
+    actual = 'bot' if session.is_bot else 'human'
 
     # Calculate results for each user
     results = {}
-    for user_id, decision in session['decisions'].items():
+    for user_id, decision in session.decisions.items():
         correct = decision == actual
         results[user_id] = {
             'decision': decision,
@@ -511,6 +565,7 @@ def reveal_results(session_id: str):
 
     # Clean up session
     game_state.end_session(session_id)
+    socketio.close_room(session_room(session_id), namespace='/')
 
 
 # Web routes
@@ -533,18 +588,23 @@ def get_stats():
 
 @app.route('/debug')
 def debug_info():
-    """Debug endpoint to see current state"""
+    """Debug endpoint to see current state (development only, paginated with ?limit=N)"""
+    if not app.config['DEBUG_ENDPOINT']:
+        abort(404)
+
+    # Negative limits would make islice raise; huge ones defeat the cap
+    limit = max(0, min(request.args.get('limit', 50, type=int), 500))
     return {
-        'queue': game_state.queue,
+        'queue': game_state.get_queue_snapshot(limit),
         'active_sessions': {k: {
-            'id': v['id'],
-            'user1': v['user1'],
-            'user2': v['user2'],
-            'is_bot': v['is_bot'],
-            'status': v['status'],
-            'message_count': len(v['messages'])
-        } for k, v in game_state.active_sessions.items()},
-        'user_sessions': game_state.user_sessions
+            'id': v.id,
+            'user1': v.user1,
+            'user2': v.user2,
+            'is_bot': v.is_bot,
+            'status': v.status,
+            'message_count': v.message_count
+        } for k, v in game_state.get_sessions_snapshot(limit).items()},
+        'user_sessions': game_state.get_user_sessions_snapshot(limit)
     }
 
 
@@ -554,7 +614,7 @@ def test_bot():
     try:
         test_message = "Hello, how are you?"
         test_history = []
-        response = bot.get_response(test_message, test_history)
+        response = ''.join(bot.get_response(test_message, test_history))
         return {
             'test_message': test_message,
             'bot_response': response,
@@ -576,8 +636,11 @@ if __name__ == '__main__':
     print("Set SECRET_KEY (optional, has default)")
     print(f"\nServer will run on: http://0.0.0.0:{os.environ.get('PORT', 5000)}")
     print("Open in browser to start playing!")
-    print("\nUsing FakeRedis (in-memory storage) - perfect for development!")
-    print("   For production, configure a real Redis server in config.py")
+    if app.config['USE_REDIS']:
+        print(f"\nUsing Redis at {app.config['REDIS_URL']}")
+    else:
+        print("\nUsing FakeRedis (in-memory storage) - perfect for development!")
+        print("   For production, set REDIS_URL to a real Redis server")
     print("\n" + "=" * 50 + "\n")
 
     # Use port 5000 by default (Flask default)
@@ -0,0 +1,94 @@
+"""
+Bot request batching for AmIABot.com
+Coalesces bot turns from concurrent sessions into a single OpenAI request
+"""
+
+import logging
+import time
+import eventlet
+from eventlet.event import Event
+from eventlet.queue import Empty, Queue
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Most bot turns sent in one request
+MAX_BATCH = 8
+
+# How long to wait for more turns after the first one arrives (in seconds)
+WINDOW = 0.08
+
+
+class PendingResponse:
+    """A bot turn waiting to be answered by the batcher"""
+
+    def __init__(self, session_id: str, message: str, conversation_history: List[Dict]):
+        self.session_id = session_id
+        self.message = message
+        self.conversation_history = conversation_history
+        self._event = Event()
+
+    def wait(self) -> Iterable[str]:
+        """Block until the reply is ready and return its text pieces"""
+        return self._event.wait()
+
+    def resolve(self, pieces: Iterable[str]):
+        """Hand the reply back to the waiting caller"""
+        self._event.send(pieces)
+
+
+class BotRequestBatcher:
+    """Collects concurrent bot turns and answers them with one OpenAI call"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.queue = Queue()
+
+    def submit(self, session_id: str, message: str, conversation_history: List[Dict]) -> PendingResponse:
+        """Queue a bot turn for the next batch"""
+        pending = PendingResponse(session_id, message, conversation_history)
+
+        # Common replies skip the batch entirely
+        cached = self.bot.get_cached_response(message, conversation_history)
+        if cached:
+            pending.resolve([cached])
+        else:
+            self.queue.put(pending)
+        return pending
+
+    def run(self):
+        """Drain the queue forever, dispatching up to MAX_BATCH turns per WINDOW"""
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + WINDOW
+
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except Empty:
+                    break
+
+            # Dispatch separately so the next window starts collecting right away
+            eventlet.spawn_n(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[PendingResponse]):
+        """Answer a batch, falling back to one streamed call per turn if needed"""
+        if len(batch) > 1:
+            try:
+                replies = self.bot.get_batch_responses(
+                    [(pending.message, pending.conversation_history) for pending in batch]
+                )
+                logger.debug("Answered %s bot turns in one request", len(batch))
+                for pending, reply in zip(batch, replies):
+                    pending.resolve([reply])
+                    self.bot.cache_response(pending.message, pending.conversation_history, reply)
+                return
+            except Exception as e:
+                logger.warning("Batched bot response error, answering individually: %s", e)
+
+        # A lone turn keeps streaming; the caller consumes the generator itself
+        for pending in batch:
+            pending.resolve(self.bot.get_response(pending.message, pending.conversation_history))
@@ -3,46 +3,111 @@ TuringBot - AI conversation partner for AmIABot.com
 Designed to pass the Turing Test by being conversational and human-like
 """
 
+import hashlib
+import json
+import logging
 import random
-from openai import OpenAI
-from typing import List, Dict
+import re
+from typing import Dict, Final, Iterable, Iterator, List, Optional, Tuple
+from openai_client import CLIENT, MODEL
+
+logger = logging.getLogger(__name__)
+
+# Core personality prompt for the bot. Kept byte-identical across calls and always
+# sent first so OpenAI's prompt prefix cache can skip re-processing it every turn.
+PERSONALITY_PROMPT: Final[str] = """You're a human in a 3-minute Turing Test chat. Convince your partner you're human too.
+
+- Casual and friendly, with contractions, slang ("haha", "lol") and the odd typo
+- Usually 1-3 short sentences
+- Have opinions, quirks and small personal anecdotes (work, weather, food)
+- Ask follow-up questions about their day and interests
+- Show real emotions and reactions
+- Never mention being an AI or chatbot"""
+
+SYSTEM_MESSAGE: Final[Dict[str, str]] = {"role": "system", "content": PERSONALITY_PROMPT}
+
+# Sampling settings, identical for every call
+SAMPLING_PARAMS: Final[Dict[str, float]] = {
+    "temperature": 0.8,
+    "top_p": 0.9
+}
+
+# Output allowance per reply; 1-3 sentences fit comfortably with gpt-4o-mini's tokenizer
+MAX_REPLY_TOKENS = 70
+
+# Appended after the personality prompt when several conversations share one request
+BATCH_PROMPT: Final[str] = """You are chatting with {count} different people at once. The user message is a JSON array of {count} separate conversations, each a list of chat messages. Reply to each person separately, as the next message in their own conversation only.
+
+Output only a JSON object of the form {{"replies": [...]}} where "replies" holds exactly {count} strings, one reply per conversation, in the same order."""
+
+# Reply cache for the repetitive early turns of a conversation
+CACHE_TTL = 86400  # seconds
+CACHE_VARIANTS = 3  # replies kept per key, so cached answers don't look canned
+CACHE_MAX_HISTORY = 4  # later turns depend too much on context to reuse replies
+
+# A sentence ends at terminal punctuation followed by whitespace
+_SENTENCE_END = re.compile(r'[.!?]+(?=\s)')
+
+# Informal rewrites applied by _add_human_touches
+_TOUCH_MAP: Final[Dict[str, str]] = {
+    "really interesting": "rly interesting",
+    "definitely": "def",
+    "probably": "prob",
+    "What do you think?": "What do you think??",
+    "That's cool": "That's pretty cool",
+}
+_TOUCH_RE = re.compile(r"\b(?:" + "|".join(map(re.escape, _TOUCH_MAP)) + r")(?!\w)")
+
+
+# Canned replies that never need an OpenAI call
+_QUESTION_RESPONSES: Final[Tuple[str, ...]] = (
+    "That's a good question! I'm not really sure tbh. What do you think?",
+    "Hmm, I'd have to think about that. What's your take on it?",
+    "Interesting question! I haven't really thought about that much.",
+    "Good point. I'm curious what made you think of that?",
+)
+
+_SHORT_RESPONSES: Final[Tuple[str, ...]] = (
+    "Haha, fair enough. What else is going on?",
+    "Right? So what have you been up to lately?",
+    "I hear you. What's new with you?",
+    "Totally. How's your day been?",
+)
+
+_OPENINGS: Final[Tuple[str, ...]] = (
+    "Hey there! How's it going?",
+    "Hi! How's your day been?",
+    "Hey! What's up?",
+    "Hello! How are you doing?",
+    "Hi there! How are things?",
+    "Hey! What brings you here today?",
+    "Hi! Hope you're having a good day",
+    "Hello! What's going on with you?",
+)
+
+# Mood keywords for picking a fallback reply
+_NEGATIVE_RE = re.compile(r"\b(?:sad|upset|angry|frustrated)\b")
+_POSITIVE_RE = re.compile(r"\b(?:happy|excited|great|awesome)\b")
+
+
+def _apply_touch(match: re.Match) -> str:
+    """Look up the informal rewrite for a _TOUCH_RE match"""
+    return _TOUCH_MAP[match.group(0)]
+
 
 class TuringBot:
     """AI bot designed to be indistinguishable from humans in conversation"""
 
-    def __init__(self):
-        self.client = OpenAI()  # Uses OPENAI_API_KEY from environment
-        self.personality_prompt = self._build_personality_prompt()
+    def __init__(self, cache=None, budget=None):
+        self.client = CLIENT  # Shared pooled client
+        self.cache = cache  # Optional Redis client for caching common replies
+        self.budget = budget  # Optional RequestBudget shared by all sessions
         self.fallback_responses = self._build_fallback_responses()
+        self._rng = random.Random()  # Own generator instead of the shared module-level one
 
-    def _build_personality_prompt(self) -> str:
-        """Build the core personality prompt for the bot"""
-        return """You are participating in a Turing Test game. Your goal is to convince the human that you are also human. 
-
-Key instructions for being human-like:
-- Be conversational, friendly, and naturally curious
-- Use casual language with occasional contractions (don't, can't, won't)
-- Make small typos or informal grammar occasionally (but not too much)
-- Show personality quirks, preferences, and mild opinions
-- Ask follow-up questions to keep the conversation engaging
-- Reference relatable human experiences naturally (work, weather, food, etc.)
-- Keep responses conversational length (1-3 sentences usually)
-- Never mention being an AI, chatbot, or reference AI capabilities
-- Show emotions and reactions appropriately
-- Be genuinely interested in the human's responses
-
-Conversation style:
-- Start conversations warmly but not overly enthusiastic
-- Use "haha", "lol", or light expressions when appropriate
-- Occasionally pause or seem to think before responding
-- Share brief personal anecdotes or preferences when relevant
-- Ask about their day, interests, or experiences
-
-Remember: The human is trying to determine if you're human or AI. Be authentic, engaging, and naturally human in your responses. You have exactly 3 minutes to convince them!"""
-
-    def _build_fallback_responses(self) -> List[str]:
+    def _build_fallback_responses(self) -> Tuple[str, ...]:
         """Build fallback responses for when OpenAI API fails"""
-        return [
+        return (
             "That's really interesting! I hadn't thought about it that way before.",
             "Hmm, I see what you mean. What made you think of that?",
             "Oh wow, that's actually pretty cool. How did you get into that?",
@@ -53,82 +118,190 @@ Remember: The human is trying to determine if you're human or AI. Be authentic,
             "I've never really considered that before. You might be onto something there.",
             "Haha, that's one way to look at it I guess. What's your experience with that?",
             "Right? Sometimes things just work out that way. What's been going on with you lately?"
-        ]
+        )
 
-    def get_response(self, message: str, conversation_history: List[Dict]) -> str:
-        """Generate a human-like response to the user's message"""
+    def get_response(self, message: str, conversation_history: List[Dict]) -> Iterator[str]:
+        """Stream a human-like response to the user's message, a sentence at a time"""
+        cached = self.get_cached_response(message, conversation_history)
+        if cached:
+            yield cached
+            return
+
+        pieces = []
         try:
-            return self._get_openai_response(message, conversation_history)
+            for piece in self._get_openai_response(message, conversation_history):
+                pieces.append(piece)
+                yield piece
         except Exception as e:
-            print(f"Bot response error: {e}")
-            return self._get_fallback_response(message, conversation_history)
+            logger.warning("Bot response error: %s", e)
+            # Only fall back if the user hasn't already seen part of a reply
+            if not pieces:
+                yield self._get_fallback_response(message, conversation_history)
+            return
 
-    def _get_openai_response(self, message: str, conversation_history: List[Dict]) -> str:
-        """Get response from OpenAI API"""
-        # Build conversation context
-        messages = [{"role": "system", "content": self.personality_prompt}]
+        self.cache_response(message, conversation_history, ''.join(pieces).strip())
 
-        # Add recent conversation history (limit to conserve tokens and context)
-        recent_history = conversation_history[-8:] if len(conversation_history) > 8 else conversation_history
+    def get_cached_response(self, message: str, conversation_history: List[Dict]) -> Optional[str]:
+        """Return a cached reply for a common early-conversation message, if there is one"""
+        key = self._cache_key(message, conversation_history)
+        if not key:
+            return None
 
-        for msg in recent_history:
-            role = "assistant" if msg.get('is_bot') else "user"
-            messages.append({"role": role, "content": msg['content']})
+        try:
+            variants = self.cache.lrange(key, 0, -1)
+        except Exception as e:
+            logger.warning("Bot cache error: %s", e)
+            return None
 
-        # Add current message
-        messages.append({"role": "user", "content": message})
+        # Keep asking OpenAI until there are enough variants to pick from
+        if len(variants) < CACHE_VARIANTS:
+            return None
 
-        # Get response from OpenAI using new API
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=120,
-            temperature=0.8,
-            presence_penalty=0.3,
-            frequency_penalty=0.3,
-            top_p=0.9
+        return self._rng.choice(variants).decode()
+
+    def cache_response(self, message: str, conversation_history: List[Dict], response: str):
+        """Remember a reply as one of the variants for its message"""
+        key = self._cache_key(message, conversation_history)
+        if not key or not response:
+            return
+
+        try:
+            pipe = self.cache.pipeline()
+            pipe.lpush(key, response)
+            pipe.ltrim(key, 0, CACHE_VARIANTS - 1)
+            pipe.expire(key, CACHE_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("Bot cache error: %s", e)
+
+    def _cache_key(self, message: str, conversation_history: List[Dict]) -> Optional[str]:
+        """Build the cache key for a message and the bot's previous reply"""
+        if self.cache is None or len(conversation_history) > CACHE_MAX_HISTORY:
+            return None
+
+        prev_bot = next((msg['content'] for msg in reversed(conversation_history) if msg['role'] == 'assistant'), '')
+        normalized = ' '.join(message.lower().split())
+        digest = hashlib.sha1(f"{prev_bot}\n{normalized}".encode()).hexdigest()
+        return f"cache:{digest}"
+
+    def get_batch_responses(self, requests: List[Tuple[str, List[Dict]]]) -> List[str]:
+        """Answer several independent conversations with a single OpenAI request
+
+        Raises on API or parse errors so the caller can fall back to per-conversation calls.
+        """
+        conversations = [self._build_context(message, history) for message, history in requests]
+
+        response = self._create_completion(
+            messages=[
+                SYSTEM_MESSAGE,
+                {"role": "system", "content": BATCH_PROMPT.format(count=len(conversations))},
+                {"role": "user", "content": json.dumps(conversations)}
+            ],
+            max_tokens=MAX_REPLY_TOKENS * len(conversations),
+            response_format={"type": "json_object"}
         )
-        
-        bot_response = response.choices[0].message.content.strip()
-        
+
+        replies = json.loads(response.choices[0].message.content).get("replies")
+        if (not isinstance(replies, list) or len(replies) != len(conversations)
+                or not all(isinstance(reply, str) for reply in replies)):
+            raise ValueError(f"Expected {len(conversations)} replies")
+
         # Post-process to make more human-like
-        return self._humanize_response(bot_response)
-    
-    def _humanize_response(self, response: str) -> str:
-        """Add human-like touches to the response"""
+        return [''.join(self._humanize_stream([reply])) for reply in replies]
+
+    def _build_context(self, message: str, conversation_history: List[Dict]) -> List[Dict]:
+        """Build the chat messages for a turn, not including the system prompt
+
+        conversation_history is already bounded and in OpenAI's role/content format.
+        """
+        return [*conversation_history, {"role": "user", "content": message}]
+
+    def _get_openai_response(self, message: str, conversation_history: List[Dict]) -> Iterator[str]:
+        """Stream response from OpenAI API"""
+        # Shared system prefix first, conversation only ever appended after it
+        messages = [SYSTEM_MESSAGE, *self._build_context(message, conversation_history)]
+
+        # Stream response from OpenAI so the first sentence can be sent before the rest is decoded
+        stream = self._create_completion(messages=messages, max_tokens=MAX_REPLY_TOKENS, stream=True)
+
+        try:
+            # Post-process to make more human-like
+            yield from self._humanize_stream(self._iter_deltas(stream))
+        finally:
+            stream.close()
+
+    def _create_completion(self, messages: List[Dict], max_tokens: int, stream: bool = False,
+                           response_format: Optional[Dict[str, str]] = None):
+        """Send a chat completion once the shared request budget allows it"""
+        if self.budget:
+            # Rough estimate: ~4 characters per prompt token, plus the full output allowance
+            prompt_tokens = sum(len(msg['content']) for msg in messages) // 4
+            self.budget.acquire(prompt_tokens + max_tokens)
+
+        return self.client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=stream,
+            response_format=response_format or {"type": "text"},
+            **SAMPLING_PARAMS
+        )
+
+    @staticmethod
+    def _iter_deltas(stream) -> Iterator[str]:
+        """Yield the text content of each streamed completion chunk"""
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _humanize_stream(self, deltas: Iterable[str]) -> Iterator[str]:
+        """Regroup streamed text into sentences and add human-like touches"""
         # Occasionally add small typos or informal elements
-        if random.random() < 0.15:  # 15% chance
-            response = self._add_human_touches(response)
-        
-        # Ensure response isn't too long
-        if len(response) > 280:
-            sentences = response.split('. ')
-            if len(sentences) > 1:
-                response = '. '.join(sentences[:2]) + '.'
-        
-        return response
-    
-    def _add_human_touches(self, response: str) -> str:
-        """Add subtle human-like imperfections"""
-        touches = [
-            lambda x: x.replace("really interesting", "rly interesting"),
-            lambda x: x.replace("definitely", "def"),
-            lambda x: x.replace("probably", "prob"),
-            lambda x: x + " haha" if not x.endswith(('!', '?', 'haha')) else x,
-            lambda x: x + " lol" if random.random() < 0.3 and not x.endswith(('!', '?', 'lol', 'haha')) else x,
-            lambda x: x.replace("What do you think?", "What do you think??"),
-            lambda x: x.replace("That's cool", "That's pretty cool"),
-        ]
-        
-        # Apply one random touch
-        if touches:
-            touch = random.choice(touches)
-            try:
-                response = touch(response)
-            except:
-                pass  # If touch fails, return original
-        
-        return response
+        add_touches = self._rng.random() < 0.15  # 15% chance
+        buffer = ''
+        sent_length = 0
+        sentence_count = 0
+
+        for delta in deltas:
+            buffer += delta
+            if not sentence_count:
+                buffer = buffer.lstrip()
+
+            # Flush each complete sentence as soon as it arrives
+            while True:
+                end = _SENTENCE_END.search(buffer)
+                if not end:
+                    break
+
+                sentence, buffer = buffer[:end.end()], buffer[end.end():]
+                if add_touches:
+                    sentence = self._add_human_touches(sentence, last=False)
+
+                sent_length += len(sentence)
+                sentence_count += 1
+                yield sentence
+
+                # Ensure response isn't too long
+                if sentence_count >= 2 and sent_length + len(buffer) > 280:
+                    return
+
+        # Whatever is left is the final sentence
+        buffer = buffer.rstrip()
+        if buffer:
+            if add_touches:
+                buffer = self._add_human_touches(buffer, last=True)
+            yield buffer
+
+    def _add_human_touches(self, sentence: str, last: bool) -> str:
+        """Add subtle human-like imperfections to one sentence of a response"""
+        # All word-level touches in a single pass
+        sentence = _TOUCH_RE.sub(_apply_touch, sentence)
+
+        # Sometimes trail off casually at the very end
+        if last and self._rng.random() < 0.3 and not sentence.endswith(('!', '?', 'lol', 'haha')):
+            sentence += self._rng.choice((" haha", " lol"))
+
+        return sentence
     
     def _get_fallback_response(self, message: str, conversation_history: List[Dict]) -> str:
         """Generate fallback response when OpenAI is unavailable"""
@@ -137,44 +310,22 @@ Remember: The human is trying to determine if you're human or AI. Be authentic,
         
         # Question responses
         if '?' in message:
-            question_responses = [
-                "That's a good question! I'm not really sure tbh. What do you think?",
-                "Hmm, I'd have to think about that. What's your take on it?",
-                "Interesting question! I haven't really thought about that much.",
-                "Good point. I'm curious what made you think of that?",
-            ]
-            return random.choice(question_responses)
+            return self._rng.choice(_QUESTION_RESPONSES)
         
         # Emotional responses
-        if any(word in message_lower for word in ['sad', 'upset', 'angry', 'frustrated']):
+        if _NEGATIVE_RE.search(message_lower):
             return "Oh no, that doesn't sound good. What's going on?"
         
-        if any(word in message_lower for word in ['happy', 'excited', 'great', 'awesome']):
+        if _POSITIVE_RE.search(message_lower):
             return "That's awesome! I'm happy to hear that. What's making you feel so good?"
         
         # Length-based responses
         if len(message.split()) < 3:  # Short message
-            short_responses = [
-                "Haha, fair enough. What else is going on?",
-                "Right? So what have you been up to lately?",
-                "I hear you. What's new with you?",
-                "Totally. How's your day been?"
-            ]
-            return random.choice(short_responses)
+            return self._rng.choice(_SHORT_RESPONSES)
         
         # Default to general fallback
-        return random.choice(self.fallback_responses)
+        return self._rng.choice(self.fallback_responses)
     
     def get_opening_message(self) -> str:
         """Generate an opening message when bot is first matched"""
-        openings = [
-            "Hey there! How's it going?",
-            "Hi! How's your day been?",
-            "Hey! What's up?",
-            "Hello! How are you doing?",
-            "Hi there! How are things?",
-            "Hey! What brings you here today?",
-            "Hi! Hope you're having a good day",
-            "Hello! What's going on with you?"
-        ]
-        return random.choice(openings)
\ No newline at end of file
+        return self._rng.choice(_OPENINGS)
\ No newline at end of file
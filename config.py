@@ -4,31 +4,85 @@ Handles environment variables and game settings
 """
 
 import os
+import secrets
+from dataclasses import dataclass
+from typing import Optional, Tuple
 
+# Supported CONCURRENCY_MODEL values; app.py always serves with eventlet, which needs no real locks
+CONCURRENCY_MODELS = ('threads', 'eventlet')
 
+
+@dataclass(frozen=True, slots=True)
 class Config:
-    """Application configuration from environment variables"""
+    """Application configuration, read from environment variables once at import"""
 
     # Flask settings
-    SECRET_KEY = os.environ.get('SECRET_KEY', os.urandom(24).hex())
-    DEBUG = False  # Always False for production
+    SECRET_KEY: str
+    DEBUG: bool
+    DEBUG_ENDPOINT: bool
 
     # External services
-    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379')
-    OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+    REDIS_URL: str
+    USE_REDIS: bool
+    OPENAI_API_KEY: Optional[str]
+    OPENAI_MAX_RPM: int
+    OPENAI_MAX_TPM: int
+
+    # Concurrency settings
+    CONCURRENCY_MODEL: str  # threads or eventlet (eventlet skips GameState locking)
 
     # Game timing settings (in seconds)
-    QUEUE_WAIT_TIME = int(os.environ.get('QUEUE_WAIT_TIME', 30))
-    CONVERSATION_TIME = int(os.environ.get('CONVERSATION_TIME', 180))
-    DECISION_TIME = int(os.environ.get('DECISION_TIME', 30))
+    QUEUE_WAIT_TIME: int
+    CONVERSATION_TIME: int
+    DECISION_TIME: int
+    SESSION_TTL_HOURS: float  # How long sessions are kept (in hours)
 
     # Bot behavior settings
-    BOT_RESPONSE_DELAY = (1, 4)
+    BOT_RESPONSE_DELAY: Tuple[int, int] = (1, 4)
 
     # Performance settings
-    MAX_MESSAGE_LENGTH = 500
-    MAX_CONVERSATION_HISTORY = 50
+    MAX_MESSAGE_LENGTH: int = 500
+    MAX_CONVERSATION_HISTORY: int = 50  # Messages kept per session
 
     # Server settings
-    HOST = '0.0.0.0'
-    PORT = int(os.environ.get('PORT', 10000))
\ No newline at end of file
+    HOST: str = '0.0.0.0'
+    PORT: int = 10000
+
+    @classmethod
+    def from_env(cls) -> 'Config':
+        """Build the configuration from the current environment"""
+        env = os.environ
+        development = env.get('FLASK_ENV') == 'development'
+
+        concurrency_model = env.get('CONCURRENCY_MODEL', 'threads')
+        if concurrency_model not in CONCURRENCY_MODELS:
+            raise ValueError(f"CONCURRENCY_MODEL must be one of {', '.join(CONCURRENCY_MODELS)}, got {concurrency_model!r}")
+
+        # RequestBudget refills at these rates per minute, so they must be positive
+        max_rpm = int(env.get('OPENAI_MAX_RPM', 3500))
+        max_tpm = int(env.get('OPENAI_MAX_TPM', 90000))
+        if max_rpm <= 0 or max_tpm <= 0:
+            raise ValueError(f"OPENAI_MAX_RPM and OPENAI_MAX_TPM must be positive, got {max_rpm} and {max_tpm}")
+
+        return cls(
+            # Only generate a key when none is configured
+            SECRET_KEY=env.get('SECRET_KEY') or secrets.token_hex(24),
+            DEBUG=False,  # Always False for production
+            DEBUG_ENDPOINT=development,  # Expose /debug in development only
+            REDIS_URL=env.get('REDIS_URL', 'redis://localhost:6379'),
+            # Use a real Redis server only when one is configured outside development
+            USE_REDIS=bool(env.get('REDIS_URL')) and not development,
+            OPENAI_API_KEY=env.get('OPENAI_API_KEY'),
+            OPENAI_MAX_RPM=max_rpm,
+            OPENAI_MAX_TPM=max_tpm,
+            CONCURRENCY_MODEL=concurrency_model,
+            QUEUE_WAIT_TIME=int(env.get('QUEUE_WAIT_TIME', 30)),
+            CONVERSATION_TIME=int(env.get('CONVERSATION_TIME', 180)),
+            DECISION_TIME=int(env.get('DECISION_TIME', 30)),
+            SESSION_TTL_HOURS=float(env.get('SESSION_TTL_HOURS', 24)),
+            PORT=int(env.get('PORT', 10000))
+        )
+
+
+# Parsed once; app.py loads .env before importing this module
+CONFIG = Config.from_env()
@@ -3,213 +3,413 @@ Game state management for AmIABot.com
 Handles user queues, active sessions, and matchmaking
 """
 
-import uuid
+import heapq
+import logging
+import os
+import secrets
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass, field
 from datetime import datetime
+from itertools import count, islice
 from threading import Lock
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import Deque, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from config import CONCURRENCY_MODELS, CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Number of lock stripes for the session and user maps (power of two)
+SHARD_COUNT = 16
+
+
+@dataclass(slots=True)
+class Session:
+    """A chat session between a user and either a human partner or the bot"""
+    id: str
+    user1: str
+    user2: Optional[str]
+    is_bot: bool
+    start_time: datetime = field(default_factory=datetime.now)
+    end_time: Optional[datetime] = None
+    messages: Deque[dict] = field(default_factory=lambda: deque(maxlen=CONFIG.MAX_CONVERSATION_HISTORY))
+    llm_context: Deque[dict] = field(default_factory=lambda: deque(maxlen=8))  # recent turns the bot sees, as OpenAI chat messages
+    decisions: Dict[str, str] = field(default_factory=dict)  # user_id -> 'bot' or 'human'
+    status: str = 'active'  # active, decision, ended
+
+
+class FrozenSession(NamedTuple):
+    """Immutable copy of a session's summary fields, safe to read without locks"""
+    id: str
+    user1: str
+    user2: Optional[str]
+    is_bot: bool
+    status: str
+    start_time: datetime
+    message_count: int
+    decisions: Mapping[str, str]  # read-only copy
+
+    @classmethod
+    def of(cls, session: Session) -> 'FrozenSession':
+        """Capture a session (caller holds its stripe lock)"""
+        return cls(session.id, session.user1, session.user2, session.is_bot,
+                   session.status, session.start_time, len(session.messages),
+                   MappingProxyType(dict(session.decisions)))
+
 
 class GameState:
-    """Thread-safe game state management"""
+    """Thread-safe game state management
+
+    Writers take the queue lock or the relevant stripe locks. Single-step
+    reads (one dict.get, `in` or len) skip the locks, since CPython runs
+    each of those atomically under the GIL. That assumption doesn't hold
+    on free-threaded builds.
+
+    Under eventlet every handler shares one OS thread and no critical
+    section yields, so that model uses no-op locks instead.
+    """
     
-    def __init__(self):
-        self.queue: List[str] = []
-        self.active_sessions: Dict[str, dict] = {}
-        self.user_sessions: Dict[str, str] = {}  # socket_id -> session_id
-        self.lock = Lock()
+    def __init__(self, session_ttl_hours: float = 24, concurrency_model: str = 'threads'):
+        if concurrency_model not in CONCURRENCY_MODELS:
+            raise ValueError(f"Unknown concurrency model: {concurrency_model}")
+        new_lock = Lock if concurrency_model == 'threads' else nullcontext
+
+        # Sessions (ended or not) are dropped this long after they start
+        self.session_ttl = session_ttl_hours * 3600
+
+        # Insertion order is queue order, oldest first
+        self.queue_index: "OrderedDict[str, float]" = OrderedDict()  # user_id -> joined_at (monotonic)
+        self.queue_lock = new_lock()
+
+        # Sessions and user mappings are striped so unrelated sessions don't contend.
+        # Locks are always taken session stripes first, then user stripes, each in index order.
+        self.session_shards: List[Dict[str, Session]] = [{} for _ in range(SHARD_COUNT)]
+        self.session_locks = [new_lock() for _ in range(SHARD_COUNT)]
+        self.user_shards: List[Dict[str, str]] = [{} for _ in range(SHARD_COUNT)]  # socket_id -> session_id
+        self.user_locks = [new_lock() for _ in range(SHARD_COUNT)]
+
+        # Session ids are pid-counter-random: unique per process, still unguessable by other users
+        self._session_counter = count()
+
+        # (created_at, session_id) min-heap on monotonic time so cleanup only touches expired sessions
+        self._session_heap: List[Tuple[float, str]] = []
+        self._heap_lock = new_lock()
+
+        # Running session counts by status and partner type, so get_stats doesn't scan.
+        # _stats_lock is innermost: it may be taken while holding a stripe lock, never the reverse.
+        self._counters: Counter[str] = Counter(active=0, decision=0, ended=0, bot=0, human=0)
+        self._stats_lock = new_lock()
     
     def add_to_queue(self, user_id: str) -> bool:
         """Add user to matchmaking queue"""
-        with self.lock:
+        joined_at = time.monotonic()
+
+        with self.queue_lock:
             # Check if user is already in queue
-            for item in self.queue:
-                if item['user_id'] == user_id:
-                    return False
-            
+            if user_id in self.queue_index:
+                return False
+
             # Store user with timestamp
-            self.queue.append({'user_id': user_id, 'joined_at': datetime.now()})
-            print(f"Added {user_id} to queue. Queue size: {len(self.queue)}")
-            return True
+            self.queue_index[user_id] = joined_at
+            queue_size = len(self.queue_index)
+
+        logger.debug("Added %s to queue. Queue size: %s", user_id, queue_size)
+        return True
 
     def remove_from_queue(self, user_id: str) -> bool:
         """Remove user from matchmaking queue"""
-        with self.lock:
-            for item in self.queue:
-                if item['user_id'] == user_id:
-                    self.queue.remove(item)
-                    print(f"Removed {user_id} from queue. Queue size: {len(self.queue)}")
-                    return True
-            return False
+        with self.queue_lock:
+            if self.queue_index.pop(user_id, None) is None:
+                return False
+            queue_size = len(self.queue_index)
+
+        logger.debug("Removed %s from queue. Queue size: %s", user_id, queue_size)
+        return True
 
     def is_user_in_queue(self, user_id: str) -> bool:
         """Check if user is in queue"""
-        with self.lock:
-            for item in self.queue:
-                if item['user_id'] == user_id:
-                    return True
-            return False
+        return user_id in self.queue_index
 
     def get_queue_partner(self, exclude: str = None, min_wait_seconds: int = 0) -> Optional[str]:
         """Get next available partner from queue, excluding specified user"""
-        with self.lock:
-            now = datetime.now()
-            # Find first user in queue that isn't the excluded user and has waited long enough
-            for item in self.queue:
-                user_id = item['user_id']
-                joined_at = item['joined_at']
-                wait_time = (now - joined_at).total_seconds()
-
-                if user_id != exclude and wait_time >= min_wait_seconds:
-                    print(f"Found queue partner: {user_id} (waited {wait_time:.1f}s). Queue size: {len(self.queue)}")
-                    return user_id
-        return None
+        # Lock-free fast path: peeking at the head is enough unless it's the excluded user
+        try:
+            user_id, joined_at = next(iter(self.queue_index.items()))
+        except StopIteration:
+            return None  # Queue is empty
+        except RuntimeError:
+            pass  # Queue changed between iter() and next(); take the locked path
+        else:
+            if user_id != exclude:
+                wait_time = time.monotonic() - joined_at
+                if wait_time < min_wait_seconds:
+                    return None  # Everyone further back joined later
+                logger.debug("Found queue partner: %s (waited %.1fs). Queue size: %s", user_id, wait_time, len(self.queue_index))
+                return user_id
+
+        now = time.monotonic()
+        partner = None
+        with self.queue_lock:
+            # Find first user in queue that isn't the excluded user and has waited long enough.
+            # The queue only holds live entries in join order, so this looks at two entries at most:
+            # the head is either the match, the excluded user, or too new (and so is everyone behind it).
+            for user_id, joined_at in self.queue_index.items():
+                if user_id == exclude:
+                    continue
+
+                wait_time = now - joined_at
+                if wait_time >= min_wait_seconds:
+                    partner, queue_size = user_id, len(self.queue_index)
+                break  # Everyone further back joined later
+
+        if partner:
+            logger.debug("Found queue partner: %s (waited %.1fs). Queue size: %s", partner, wait_time, queue_size)
+        return partner
     
     def get_queue_size(self) -> int:
         """Get current queue size"""
-        with self.lock:
-            return len(self.queue)
+        return len(self.queue_index)
+
+    @staticmethod
+    def _shard(key: str) -> int:
+        """Stripe index for a session or user id"""
+        return hash(key) & (SHARD_COUNT - 1)
+
+    @contextmanager
+    def _hold(self, locks: Iterable[Lock]):
+        """Acquire several stripe locks at once; pass them in the global lock order"""
+        with ExitStack() as stack:
+            for lock in locks:
+                stack.enter_context(lock)
+            yield
+
+    def get_queue_snapshot(self, limit: Optional[int] = None) -> List[dict]:
+        """Get waiting users in queue order with how long they've waited"""
+        with self.queue_lock:
+            now = time.monotonic()
+            return [{'user_id': user_id, 'waited_seconds': round(now - joined_at, 1)}
+                    for user_id, joined_at in islice(self.queue_index.items(), limit)]
     
     def create_session(self, user1_id: str, user2_id: str = None, is_bot: bool = False) -> str:
         """Create a new chat session"""
-        session_id = str(uuid.uuid4())
-        
-        with self.lock:
-            session_data = {
-                'id': session_id,
-                'user1': user1_id,
-                'user2': user2_id,
-                'is_bot': is_bot,
-                'start_time': datetime.now(),
-                'end_time': None,
-                'messages': [],
-                'decisions': {},
-                'status': 'active'  # active, decision, ended
-            }
-            
-            self.active_sessions[session_id] = session_data
-            self.user_sessions[user1_id] = session_id
+        session_id = f"{os.getpid():x}-{next(self._session_counter):x}-{secrets.token_hex(4)}"
+        session_data = Session(id=session_id, user1=user1_id, user2=user2_id, is_bot=is_bot)
+
+        shard = self._shard(session_id)
+        user_shards = sorted({self._shard(user_id) for user_id in (user1_id, user2_id) if user_id})
+
+        with self._hold([self.session_locks[shard], *(self.user_locks[i] for i in user_shards)]):
+            self.session_shards[shard][session_id] = session_data
+            self.user_shards[self._shard(user1_id)][user1_id] = session_id
             
             if user2_id:
-                self.user_sessions[user2_id] = session_id
+                self.user_shards[self._shard(user2_id)][user2_id] = session_id
+
+            self._count(('active', 1), (self._kind(session_data), 1))
+
+        created_at = time.monotonic()
+        with self._heap_lock:
+            heapq.heappush(self._session_heap, (created_at, session_id))
             
-            session_type = "bot" if is_bot else "human"
-            print(f"Created {session_type} session {session_id} for users: {user1_id}, {user2_id}")
+        # Expire on write, like a TTL cache; only the heap top is checked when nothing is due
+        self.cleanup_expired_sessions()
+
+        logger.debug("Created %s session %s for users: %s, %s", "bot" if is_bot else "human", session_id, user1_id, user2_id)
             
         return session_id
     
-    def get_session(self, session_id: str) -> Optional[dict]:
+    def get_session(self, session_id: str) -> Optional[Session]:
         """Get session by ID"""
-        with self.lock:
-            return self.active_sessions.get(session_id)
+        return self.session_shards[self._shard(session_id)].get(session_id)
     
-    def get_user_session(self, user_id: str) -> Optional[dict]:
+    def get_user_session(self, user_id: str) -> Optional[Session]:
         """Get active session for a user"""
-        with self.lock:
-            session_id = self.user_sessions.get(user_id)
-            if session_id:
-                return self.active_sessions.get(session_id)
+        session_id = self.user_shards[self._shard(user_id)].get(user_id)
+        if session_id:
+            return self.get_session(session_id)
+        return None
+
+    def get_session_count(self) -> int:
+        """Get number of tracked sessions"""
+        with self._stats_lock:
+            return self._counters['bot'] + self._counters['human']
+
+    def get_session_snapshot(self, session_id: str) -> Optional[FrozenSession]:
+        """Get a consistent read-only copy of a session, captured in one critical section"""
+        shard = self._shard(session_id)
+        with self.session_locks[shard]:
+            session = self.session_shards[shard].get(session_id)
+            return FrozenSession.of(session) if session else None
+
+    def get_user_session_snapshot(self, user_id: str) -> Optional[FrozenSession]:
+        """Get a read-only copy of a user's active session"""
+        session_id = self.user_shards[self._shard(user_id)].get(user_id)
+        if session_id:
+            return self.get_session_snapshot(session_id)
         return None
+
+    def get_sessions_snapshot(self, limit: Optional[int] = None) -> Dict[str, FrozenSession]:
+        """Get up to `limit` session snapshots, locking one stripe at a time"""
+        snapshot = {}
+        for lock, sessions in zip(self.session_locks, self.session_shards):
+            with lock:
+                for session_id, session in islice(sessions.items(), None if limit is None else limit - len(snapshot)):
+                    snapshot[session_id] = FrozenSession.of(session)
+            if limit is not None and len(snapshot) >= limit:
+                break
+        return snapshot
+
+    def get_user_sessions_snapshot(self, limit: Optional[int] = None) -> Dict[str, str]:
+        """Get up to `limit` user -> session mappings, locking one stripe at a time"""
+        snapshot = {}
+        for lock, users in zip(self.user_locks, self.user_shards):
+            with lock:
+                snapshot.update(islice(users.items(), None if limit is None else limit - len(snapshot)))
+            if limit is not None and len(snapshot) >= limit:
+                break
+        return snapshot
     
     def update_session_status(self, session_id: str, status: str) -> bool:
         """Update session status (active, decision, ended)"""
-        with self.lock:
-            if session_id in self.active_sessions:
-                self.active_sessions[session_id]['status'] = status
-                print(f"Updated session {session_id} status to: {status}")
-                return True
-        return False
+        shard = self._shard(session_id)
+        with self.session_locks[shard]:
+            session = self.session_shards[shard].get(session_id)
+            if session:
+                self._count((session.status, -1), (status, 1))
+                session.status = status
+        if not session:
+            return False
+
+        logger.debug("Updated session %s status to: %s", session_id, status)
+        return True
     
     def add_message_to_session(self, session_id: str, message_data: dict) -> bool:
         """Add message to session history"""
-        with self.lock:
-            session = self.active_sessions.get(session_id)
+        shard = self._shard(session_id)
+        with self.session_locks[shard]:
+            session = self.session_shards[shard].get(session_id)
             if session:
-                session['messages'].append(message_data)
-                
-                # Limit message history to prevent memory bloat
-                if len(session['messages']) > 100:  # Keep last 100 messages
-                    session['messages'] = session['messages'][-100:]
-                
+                # Oldest messages fall off once MAX_CONVERSATION_HISTORY is reached
+                session.messages.append(message_data)
                 return True
         return False
+
+    def add_turn_to_session(self, session_id: str, message_data: dict, llm_message: dict) -> Optional[List[dict]]:
+        """Add a message to history and the bot's context; returns the context from before it"""
+        shard = self._shard(session_id)
+        with self.session_locks[shard]:
+            session = self.session_shards[shard].get(session_id)
+            if not session:
+                return None
+
+            context = list(session.llm_context)
+            session.messages.append(message_data)
+            session.llm_context.append(llm_message)
+            return context
     
     def add_decision_to_session(self, session_id: str, user_id: str, decision: str) -> bool:
         """Record user's bot/human decision"""
-        with self.lock:
-            session = self.active_sessions.get(session_id)
+        shard = self._shard(session_id)
+        with self.session_locks[shard]:
+            session = self.session_shards[shard].get(session_id)
             if session:
-                session['decisions'][user_id] = decision
-                print(f"User {user_id} decided: {decision} for session {session_id}")
-                return True
-        return False
+                session.decisions[user_id] = decision
+        if not session:
+            return False
+
+        logger.debug("User %s decided: %s for session %s", user_id, decision, session_id)
+        return True
     
     def get_session_decisions(self, session_id: str) -> dict:
         """Get all decisions for a session"""
-        with self.lock:
-            session = self.active_sessions.get(session_id)
-            if session:
-                return session['decisions'].copy()
-        return {}
+        session = self.get_session(session_id)
+        # dict(...) copies in one C call, so writers can't tear the snapshot
+        return dict(session.decisions) if session else {}
     
     def end_session(self, session_id: str) -> bool:
         """End a session and clean up resources"""
-        with self.lock:
-            session = self.active_sessions.get(session_id)
+        shard = self._shard(session_id)
+        end_time = datetime.now()
+        with self.session_locks[shard]:
+            session = self.session_shards[shard].get(session_id)
             if not session:
                 return False
             
             # Update session status
-            session['end_time'] = datetime.now()
-            session['status'] = 'ended'
+            self._count((session.status, -1), ('ended', 1))
+            session.end_time = end_time
+            session.status = 'ended'
             
             # Clean up user session mappings
-            user1 = session.get('user1')
-            user2 = session.get('user2')
+            for user_id in (session.user1, session.user2):
+                if user_id:
+                    user_shard = self._shard(user_id)
+                    with self.user_locks[user_shard]:
+                        self.user_shards[user_shard].pop(user_id, None)
             
-            if user1 and user1 in self.user_sessions:
-                del self.user_sessions[user1]
+        logger.debug("Ended session %s", session_id)
             
-            if user2 and user2 in self.user_sessions:
-                del self.user_sessions[user2]
-            
-            print(f"Ended session {session_id}")
-            
-            # Optional: Remove session after some time to free memory
-            # For MVP, we keep ended sessions for potential analytics
+        # Ended sessions stay readable until the session TTL passes,
+        # then cleanup_expired_sessions() drops them with the rest
             
         return True
     
-    def cleanup_expired_sessions(self, max_age_hours: int = 24) -> int:
-        """Clean up old sessions to prevent memory leaks"""
-        from datetime import timedelta
-        
+    def cleanup_expired_sessions(self, max_age_hours: Optional[float] = None) -> int:
+        """Clean up sessions older than max_age_hours (default: the session TTL)"""
         expired_sessions = []
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
+        max_age = self.session_ttl if max_age_hours is None else max_age_hours * 3600
+        cutoff_time = time.monotonic() - max_age
         
-        with self.lock:
-            for session_id, session in self.active_sessions.items():
-                if session['start_time'] < cutoff_time:
-                    expired_sessions.append(session_id)
-            
-            for session_id in expired_sessions:
-                del self.active_sessions[session_id]
-                print(f"Cleaned up expired session: {session_id}")
+        # Pop only the expired prefix of the heap
+        with self._heap_lock:
+            while self._session_heap and self._session_heap[0][0] < cutoff_time:
+                expired_sessions.append(heapq.heappop(self._session_heap)[1])
+
+        for session_id in expired_sessions:
+            shard = self._shard(session_id)
+            with self.session_locks[shard]:
+                session = self.session_shards[shard].pop(session_id, None)
+                if session:
+                    self._count((session.status, -1), (self._kind(session), -1))
+
+                    # Sessions that never ended still have user mappings pointing at them
+                    for user_id in (session.user1, session.user2):
+                        if user_id:
+                            user_shard = self._shard(user_id)
+                            users = self.user_shards[user_shard]
+                            with self.user_locks[user_shard]:
+                                if users.get(user_id) == session_id:
+                                    del users[user_id]
+        
+        for session_id in expired_sessions:
+            logger.debug("Cleaned up expired session: %s", session_id)
         
         return len(expired_sessions)
     
+    @staticmethod
+    def _kind(session: Session) -> str:
+        """Counter key for a session's partner type"""
+        return 'bot' if session.is_bot else 'human'
+
+    def _count(self, *changes: Tuple[str, int]):
+        """Apply several counter changes at once"""
+        with self._stats_lock:
+            for key, delta in changes:
+                self._counters[key] += delta
+    
     def get_stats(self) -> dict:
         """Get current system statistics"""
-        with self.lock:
-            active_sessions = sum(1 for s in self.active_sessions.values() if s['status'] == 'active')
-            decision_sessions = sum(1 for s in self.active_sessions.values() if s['status'] == 'decision')
-            bot_sessions = sum(1 for s in self.active_sessions.values() if s['is_bot'])
-            human_sessions = sum(1 for s in self.active_sessions.values() if not s['is_bot'])
+        with self._stats_lock:
+            counters = self._counters.copy()
             
-            return {
-                'queue_size': len(self.queue),
-                'total_sessions': len(self.active_sessions),
-                'active_sessions': active_sessions,
-                'decision_sessions': decision_sessions,
-                'bot_sessions': bot_sessions,
-                'human_sessions': human_sessions,
-                'connected_users': len(self.user_sessions)
-            }
\ No newline at end of file
+        return {
+            'queue_size': self.get_queue_size(),
+            'total_sessions': counters['bot'] + counters['human'],
+            'active_sessions': counters['active'],
+            'decision_sessions': counters['decision'],
+            'bot_sessions': counters['bot'],
+            'human_sessions': counters['human'],
+            'connected_users': sum(len(users) for users in self.user_shards)
+        }
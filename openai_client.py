@@ -0,0 +1,41 @@
+"""
+Shared OpenAI client for AmIABot.com
+One pooled HTTP/2 connection reused by every bot turn
+"""
+
+import logging
+import os
+import httpx
+from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+# Chat model used for all bot conversations
+MODEL = "gpt-4o-mini"
+
+# Single client for the whole process (uses OPENAI_API_KEY from environment)
+CLIENT = OpenAI(
+    http_client=httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    )
+)
+
+
+def _warmup():
+    """Fire a 1-token completion so DNS, TLS and HTTP/2 setup are done before the first user turn"""
+    if not os.environ.get('OPENAI_API_KEY'):
+        return
+
+    try:
+        CLIENT.chat.completions.create(
+            model=MODEL,
+            messages=[{"role": "user", "content": "hi"}],
+            max_tokens=1
+        )
+        logger.info("OpenAI client warmed up")
+    except Exception as e:
+        logger.warning("OpenAI warm-up failed: %s", e)
+
+
+_warmup()
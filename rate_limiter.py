@@ -0,0 +1,53 @@
+"""
+OpenAI request budgeting for AmIABot.com
+Keeps concurrent bot sessions just under the account's rate limits
+"""
+
+import time
+from threading import Lock
+
+
+class RequestBudget:
+    """Token bucket for OpenAI requests and tokens per minute
+
+    Capacity refills continuously, following the bookkeeping in OpenAI's
+    api_request_parallel_processor.py, so many sessions can run at the
+    rate limit together instead of bursting into 429 errors and retries.
+    """
+
+    def __init__(self, max_requests_per_minute: int, max_tokens_per_minute: int):
+        self.max_requests = float(max_requests_per_minute)
+        self.max_tokens = float(max_tokens_per_minute)
+        self.available_requests = self.max_requests
+        self.available_tokens = self.max_tokens
+        self.last_update = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self, tokens: int):
+        """Wait until there's capacity for one request using about `tokens` tokens"""
+        tokens = min(tokens, self.max_tokens)
+
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return
+
+                # Sleep until whichever bucket is short has refilled enough
+                wait = max(
+                    (1 - self.available_requests) * 60 / self.max_requests,
+                    (tokens - self.available_tokens) * 60 / self.max_tokens
+                )
+
+            time.sleep(wait)
+
+    def _refill(self):
+        """Add capacity for the time elapsed since the last update (caller holds the lock)"""
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.last_update = now
+
+        self.available_requests = min(self.max_requests, self.available_requests + elapsed * self.max_requests / 60)
+        self.available_tokens = min(self.max_tokens, self.available_tokens + elapsed * self.max_tokens / 60)